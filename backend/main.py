@@ -1,23 +1,37 @@
 from fastapi import FastAPI, File, UploadFile, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
-from PIL import Image
-import io
+from fastapi.responses import ORJSONResponse, Response
+import asyncio
+import multiprocessing
 import numpy as np
+import orjson
+import os
+import xxhash
+from cachetools import LRUCache
+from concurrent.futures import ProcessPoolExecutor
 from typing import List
+import atexit
 import logging
+from logging.handlers import QueueHandler, QueueListener
+from queue import SimpleQueue
 
 from models.disease_detector import DiseaseDetector
-from utils.image_processor import ImageProcessor
+from utils.image_processor import preprocess_bytes
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
+# Configure logging: records go through a queue so formatting and
+# stderr I/O happen on a background thread instead of the event loop
+_log_queue = SimpleQueue()
+_log_listener = QueueListener(_log_queue, logging.StreamHandler())
+_log_listener.start()
+atexit.register(_log_listener.stop)
+logging.basicConfig(level=logging.INFO, handlers=[QueueHandler(_log_queue)])
 logger = logging.getLogger(__name__)
 
 app = FastAPI(
     title="Plant Disease Detector API",
     description="API for detecting diseases in plant leaves using machine learning",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=ORJSONResponse
 )
 
 # Configure CORS
@@ -31,16 +45,122 @@ app.add_middleware(
 
 # Initialize components
 disease_detector = DiseaseDetector()
-image_processor = ImageProcessor()
+
+# Reject uploads larger than this before reading them into memory
+MAX_UPLOAD_BYTES = 10 * 1024 * 1024
+
+# Dynamic batching configuration
+MAX_BATCH_SIZE = 8
+BATCH_TIMEOUT_S = 0.005  # How long to wait for more requests before running a batch
+
+# Maximum number of files accepted by /api/detect_batch (bounds memory)
+MAX_FILES_PER_BATCH = 8
+
+# Serialized responses for recently seen uploads, keyed by a fast
+# non-cryptographic hash of the image bytes. Repeat uploads (client
+# retries, double-taps) skip preprocessing and inference entirely.
+response_cache: LRUCache = LRUCache(maxsize=1024)
+
+# Queue of (preprocessed image, include_all, future) entries consumed by
+# the batch worker
+batch_queue: asyncio.Queue = None
+batch_worker_task: asyncio.Task = None
+
+async def _batch_worker():
+    """
+    Collect concurrent prediction requests into batches
+
+    Waits for the first request, then keeps collecting for a short window
+    (up to MAX_BATCH_SIZE entries) so a single model invocation serves
+    multiple in-flight requests.
+    """
+    while True:
+        entries = [await batch_queue.get()]
+
+        # Collect more requests within the batching window
+        while len(entries) < MAX_BATCH_SIZE:
+            try:
+                entries.append(
+                    await asyncio.wait_for(batch_queue.get(), timeout=BATCH_TIMEOUT_S)
+                )
+            except asyncio.TimeoutError:
+                break
+
+        try:
+            batch = np.stack([image for image, _, _ in entries], axis=0)
+
+            # Compute the per-class map once if any request in the batch
+            # asked for it; trim it from the others afterwards
+            include_all = any(flag for _, flag, _ in entries)
+            results = await disease_detector.predict_batch(batch, include_all)
+            for (_, flag, future), result in zip(entries, results):
+                if not flag:
+                    result.pop("all_predictions", None)
+                if not future.done():
+                    future.set_result(result)
+        except Exception as e:
+            # Fail this batch's requests but keep the worker alive
+            for _, _, future in entries:
+                if not future.done():
+                    future.set_exception(e)
+
+def _on_batch_worker_done(task: asyncio.Task):
+    """Restart the batch worker if it ever crashes
+
+    Without this, a dead worker would leave every subsequent request
+    awaiting a future that is never resolved.
+    """
+    if task.cancelled():
+        return
+    exc = task.exception()
+    if exc is not None:
+        logger.error("Batch worker crashed, restarting: %s", exc)
+        _start_batch_worker()
+
+def _start_batch_worker():
+    """Spawn the supervised batch worker task"""
+    global batch_worker_task
+    batch_worker_task = asyncio.create_task(_batch_worker())
+    batch_worker_task.add_done_callback(_on_batch_worker_done)
+
+async def _submit_for_prediction(image: np.ndarray, include_all: bool = False) -> dict:
+    """Submit a preprocessed image to the batch queue and wait for its result"""
+    future = asyncio.get_event_loop().create_future()
+    await batch_queue.put((image, include_all, future))
+    return await future
 
 @app.on_event("startup")
 async def startup_event():
-    """Initialize the ML model on startup"""
+    """Initialize the ML model, batch worker and preprocess pool on startup"""
+    global batch_queue
     try:
         await disease_detector.load_model()
         logger.info("Disease detection model loaded successfully")
     except Exception as e:
-        logger.error(f"Failed to load model: {e}")
+        logger.error("Failed to load model: %s", e)
+
+    # Cached responses from a previous model are no longer valid
+    response_cache.clear()
+
+    batch_queue = asyncio.Queue()
+    _start_batch_worker()
+
+    # Preprocessing runs in separate processes (bypasses the GIL). The
+    # spawn context matters twice over: forking this process once the
+    # event loop, log listener and TF/ORT thread pools exist is a
+    # deadlock risk, and spawned workers import only utils.image_processor
+    # so the model genuinely isn't duplicated into them. The pool size is
+    # a small per-process budget (like TF_INTRA_OP_THREADS) because each
+    # uvicorn worker builds its own pool.
+    app.state.preprocess_pool = ProcessPoolExecutor(
+        max_workers=int(os.environ.get("PREPROCESS_POOL_WORKERS", "2")),
+        mp_context=multiprocessing.get_context("spawn")
+    )
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Tear down the preprocessing pool on shutdown"""
+    app.state.preprocess_pool.shutdown(wait=False)
 
 @app.get("/")
 async def root():
@@ -57,13 +177,14 @@ async def health_check():
     }
 
 @app.post("/api/detect")
-async def detect_disease(file: UploadFile = File(...)):
+async def detect_disease(file: UploadFile = File(...), verbose: bool = False):
     """
     Detect plant disease from uploaded image
-    
+
     Args:
         file: Uploaded image file
-        
+        verbose: Include per-class probabilities in the response
+
     Returns:
         JSON response with detection results
     """
@@ -75,43 +196,158 @@ async def detect_disease(file: UploadFile = File(...)):
                 detail="File must be an image"
             )
         
-        # Read and process image
+        # Cap upload size before materializing the bytes
+        if file.size and file.size > MAX_UPLOAD_BYTES:
+            raise HTTPException(
+                status_code=413,
+                detail="Image too large. Maximum upload size is 10 MB."
+            )
+
+        # Read once; the decode wraps these bytes without copying
         contents = await file.read()
-        image = Image.open(io.BytesIO(contents))
-        
-        # Convert to RGB if necessary
-        if image.mode != 'RGB':
-            image = image.convert('RGB')
-        
-        # Process image for ML model
-        processed_image = image_processor.preprocess_image(image)
-        
-        # Perform disease detection
-        prediction = await disease_detector.predict(processed_image)
+
+        # Serve repeat uploads straight from the response cache
+        cache_key = (xxhash.xxh3_64_intdigest(contents), verbose)
+        cached_body = response_cache.get(cache_key)
+        if cached_body is not None:
+            return Response(cached_body, media_type="application/json")
+
+        # Decode + preprocess in the process pool so the CPU-bound work
+        # doesn't block the event loop
+        loop = asyncio.get_event_loop()
+        try:
+            processed_image = await loop.run_in_executor(
+                app.state.preprocess_pool, preprocess_bytes, contents
+            )
+        except ValueError:
+            raise HTTPException(
+                status_code=400,
+                detail="Could not decode image"
+            )
         
-        # Format response
+        # Perform disease detection (batched with other in-flight requests)
+        prediction = await _submit_for_prediction(processed_image, include_all=verbose)
+
+        # Format response; known recommendations are spliced in as a
+        # pre-serialized fragment so they aren't re-encoded per request
+        reco_json = disease_detector.recommendations_json(prediction["disease"])
         response = {
             "disease": prediction["disease"],
             "confidence": float(prediction["confidence"]),
-            "recommendations": prediction["recommendations"]
+            "recommendations": (
+                orjson.Fragment(reco_json) if reco_json is not None
+                else prediction["recommendations"]
+            )
         }
-        
-        logger.info(f"Detection completed: {prediction['disease']} ({prediction['confidence']:.2f})")
-        
-        return JSONResponse(content=response)
-        
+        if verbose:
+            response["all_predictions"] = prediction.get("all_predictions", {})
+
+        # %-style args defer formatting until the record is handled
+        if logger.isEnabledFor(logging.INFO):
+            logger.info(
+                "Detection completed: %s (%.2f)",
+                prediction["disease"], prediction["confidence"]
+            )
+
+        body = orjson.dumps(response)
+        # Don't pin transient inference failures in the cache: a retry of
+        # the same bytes should get a fresh attempt, not the cached fallback
+        if prediction["disease"] != DiseaseDetector.ANALYSIS_FAILED:
+            response_cache[cache_key] = body
+        return Response(body, media_type="application/json")
+
+    except HTTPException:
+        raise
     except Exception as e:
-        logger.error(f"Error during disease detection: {e}")
+        logger.error("Error during disease detection: %s", e)
         raise HTTPException(
             status_code=500,
             detail=f"Error processing image: {str(e)}"
         )
 
+@app.post("/api/detect_batch")
+async def detect_batch(files: List[UploadFile] = File(...), verbose: bool = False):
+    """
+    Detect plant diseases for multiple uploaded images in one model call
+
+    Args:
+        files: Uploaded image files (at most MAX_FILES_PER_BATCH)
+        verbose: Include per-class probabilities in each result
+
+    Returns:
+        JSON response with one detection result per file, in upload order
+    """
+    if len(files) > MAX_FILES_PER_BATCH:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Too many files. Maximum batch size is {MAX_FILES_PER_BATCH}."
+        )
+
+    try:
+        for file in files:
+            if not file.content_type.startswith("image/"):
+                raise HTTPException(
+                    status_code=400,
+                    detail=f"File '{file.filename}' must be an image"
+                )
+            if file.size and file.size > MAX_UPLOAD_BYTES:
+                raise HTTPException(
+                    status_code=413,
+                    detail=f"File '{file.filename}' too large. Maximum upload size is 10 MB."
+                )
+
+        contents = await asyncio.gather(*[file.read() for file in files])
+
+        # Decode + preprocess concurrently in the process pool, then run
+        # the model once over the stacked batch
+        loop = asyncio.get_event_loop()
+        try:
+            images = await asyncio.gather(*[
+                loop.run_in_executor(
+                    app.state.preprocess_pool, preprocess_bytes, data
+                )
+                for data in contents
+            ])
+        except ValueError:
+            raise HTTPException(
+                status_code=400,
+                detail="Could not decode one of the images"
+            )
+
+        batch = np.stack(images, axis=0)
+        predictions = await disease_detector.predict_batch(batch, include_all=verbose)
+
+        results = []
+        for file, prediction in zip(files, predictions):
+            result = {
+                "filename": file.filename,
+                "disease": prediction["disease"],
+                "confidence": float(prediction["confidence"]),
+                "recommendations": prediction["recommendations"]
+            }
+            if verbose:
+                result["all_predictions"] = prediction.get("all_predictions", {})
+            results.append(result)
+
+        if logger.isEnabledFor(logging.INFO):
+            logger.info("Batch detection completed for %d images", len(files))
+
+        return {"results": results}
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error("Error during batch disease detection: %s", e)
+        raise HTTPException(
+            status_code=500,
+            detail=f"Error processing images: {str(e)}"
+        )
+
 @app.get("/api/diseases")
 async def get_supported_diseases():
     """Get list of diseases that can be detected"""
-    diseases = disease_detector.get_supported_diseases()
-    return {"diseases": diseases}
+    # Body is serialized once at startup; no per-request list copy or encode
+    return Response(disease_detector.diseases_json, media_type="application/json")
 
 if __name__ == "__main__":
     import uvicorn
@@ -1,20 +1,50 @@
 import tensorflow as tf
 import numpy as np
+import orjson
 from typing import Dict, List, Optional
+import asyncio
 import logging
 import os
+import threading
 from pathlib import Path
 
 logger = logging.getLogger(__name__)
 
+# Keep TF's thread pools small so multiple uvicorn workers don't
+# oversubscribe the CPU cores between them. Override TF_INTRA_OP_THREADS
+# (e.g. to the physical core count) when running a single worker.
+try:
+    tf.config.threading.set_intra_op_parallelism_threads(
+        int(os.environ.get("TF_INTRA_OP_THREADS", "2"))
+    )
+    tf.config.threading.set_inter_op_parallelism_threads(1)
+except RuntimeError:
+    # Threading config can only be set before TF is initialized
+    pass
+
 class DiseaseDetector:
     """
     Plant disease detection model using TensorFlow
     """
-    
+
+    # Sentinel disease name used by the fallback result when inference
+    # fails; callers can check it to tell failures from real predictions
+    ANALYSIS_FAILED = "Analysis Failed"
+
     def __init__(self, model_path: Optional[str] = None):
         self.model = None
+        self._infer = None
         self.model_path = model_path or "models/plant_disease_model.h5"
+        self.tflite_path = str(Path(self.model_path).with_suffix(".tflite"))
+        self.onnx_path = str(Path(self.model_path).with_suffix(".onnx"))
+        # Serialized quantized model; interpreters are created per thread
+        # since tf.lite.Interpreter is not thread-safe
+        self._tflite_model = None
+        self._tflite_local = threading.local()
+        # ONNX Runtime session (preferred CPU runtime when available;
+        # session.run is thread-safe)
+        self._onnx_session = None
+        self._onnx_input_name = None
         self.class_names = [
             "Healthy",
             "Bacterial Spot",
@@ -99,24 +129,252 @@ class DiseaseDetector:
                 "Plant virus-resistant cultivars in future."
             ]
         }
-    
+
+        # Freeze recommendations into tuples so per-request results share
+        # the same immutable objects instead of copying lists
+        self.recommendations = {
+            name: tuple(advice) for name, advice in self.recommendations.items()
+        }
+
+        # Precomputed response data for the hot paths
+        self._class_names_tuple = tuple(self.class_names)
+        self._diseases_json = orjson.dumps({"diseases": self.class_names})
+        self._reco_json = {
+            name: orjson.dumps(advice)
+            for name, advice in self.recommendations.items()
+        }
+
+    @property
+    def diseases_json(self) -> bytes:
+        """Pre-serialized JSON body for the supported-diseases endpoint"""
+        return self._diseases_json
+
+    def recommendations_json(self, disease_name: str) -> Optional[bytes]:
+        """Pre-serialized recommendations array for a disease, if known"""
+        return self._reco_json.get(disease_name)
+
     async def load_model(self):
         """Load the pre-trained model"""
+        # Optional fp16 compute: halves weight/activation bandwidth and
+        # enables tensor cores / AVX-512 FP16 where available. Keras keeps
+        # softmax and variables in fp32 for numerical stability, and the
+        # model still accepts float32 inputs (cast happens in-graph), so
+        # the preprocessing pipeline and traced signatures are unchanged.
+        # Gated behind an env var since older CPUs emulate fp16 slowly.
+        mixed_precision = os.environ.get("ENABLE_MIXED_PRECISION", "0") == "1"
+        if mixed_precision:
+            tf.keras.mixed_precision.set_global_policy("mixed_float16")
+
         try:
             # For demo purposes, create a simple mock model
             # In production, you would load a pre-trained model
             if os.path.exists(self.model_path):
                 self.model = tf.keras.models.load_model(self.model_path)
+                if mixed_precision:
+                    # load_model restores each layer's saved float32 dtype
+                    # policy, so the global policy alone wouldn't touch a
+                    # trained model: rebuild the layers under mixed_float16
+                    # and copy the weights across
+                    rebuilt = tf.keras.models.clone_model(self.model)
+                    rebuilt.set_weights(self.model.get_weights())
+                    self.model = rebuilt
             else:
                 # Create a simple CNN model for demonstration
                 self.model = self._create_demo_model()
                 logger.warning("Using demo model. Replace with trained model for production.")
-            
+
             logger.info("Model loaded successfully")
         except Exception as e:
             logger.error(f"Failed to load model: {e}")
             # Create a fallback demo model
             self.model = self._create_demo_model()
+
+        self._build_infer_fn()
+
+        if mixed_precision:
+            # The ONNX/TFLite exports are float32 graphs; serving from
+            # them would silently bypass the fp16 compute just requested,
+            # so traffic stays on the TF runtime in this mode
+            logger.info("Mixed precision enabled; serving from the TF runtime")
+            return
+
+        self._load_onnx_model()
+        if self._onnx_session is None:
+            self._load_tflite_model()
+
+    def _artifact_is_stale(self, artifact_path: str) -> bool:
+        """
+        Check whether a cached model artifact needs regenerating
+
+        An artifact is stale when it doesn't exist yet, or when the source
+        .h5 has been replaced with a newer model since the artifact was
+        built (e.g. a trained model dropped in over the demo one).
+        """
+        if not os.path.exists(artifact_path):
+            return True
+        if os.path.exists(self.model_path):
+            return os.path.getmtime(artifact_path) < os.path.getmtime(self.model_path)
+        return False
+
+    def _load_onnx_model(self):
+        """
+        Load (or build) an ONNX Runtime session for the model
+
+        ONNX Runtime's CPU provider fuses Conv+BN+ReLU chains into
+        optimized MLAS kernels and outperforms the Keras path on CPU.
+        tf2onnx and onnxruntime are optional dependencies; the TFLite and
+        Keras paths remain as fallbacks when they're missing.
+        """
+        try:
+            import onnxruntime as ort
+        except ImportError:
+            logger.info("onnxruntime not installed, skipping ONNX backend")
+            return
+
+        try:
+            if self._artifact_is_stale(self.onnx_path):
+                import tf2onnx
+                # Convert to a per-process temp file and publish with an
+                # atomic rename so concurrent workers never read a
+                # half-written artifact
+                tmp_path = f"{self.onnx_path}.tmp-{os.getpid()}"
+                try:
+                    tf2onnx.convert.from_keras(
+                        self.model,
+                        input_signature=[
+                            tf.TensorSpec([None, 224, 224, 3], tf.float32, name="input")
+                        ],
+                        output_path=tmp_path
+                    )
+                    os.replace(tmp_path, self.onnx_path)
+                finally:
+                    if os.path.exists(tmp_path):
+                        os.remove(tmp_path)
+                logger.info("Converted model to ONNX")
+
+            sess_options = ort.SessionOptions()
+            sess_options.graph_optimization_level = (
+                ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+            )
+            sess_options.intra_op_num_threads = int(
+                os.environ.get("TF_INTRA_OP_THREADS", "2")
+            )
+            self._onnx_session = ort.InferenceSession(
+                self.onnx_path,
+                sess_options=sess_options,
+                providers=["CPUExecutionProvider"]
+            )
+            self._onnx_input_name = self._onnx_session.get_inputs()[0].name
+            logger.info("Loaded ONNX Runtime session")
+
+        except Exception as e:
+            logger.warning(f"ONNX conversion/load failed, using TF runtime: {e}")
+            self._onnx_session = None
+
+    def _onnx_infer(self, images: np.ndarray) -> np.ndarray:
+        """Run a batch through the ONNX Runtime session"""
+        return self._onnx_session.run(
+            None, {self._onnx_input_name: images.astype(np.float32, copy=False)}
+        )[0]
+
+    def _build_infer_fn(self):
+        """
+        Wrap the forward pass in a tf.function
+
+        The traced graph is reused across batch sizes, avoiding
+        model.predict's per-call overhead. XLA compilation fuses the
+        conv/bias/relu/pool chains into single kernels; if XLA is not
+        available on this platform we fall back to a plain tf.function.
+        Warming with a dummy input keeps the trace/compile cost off the
+        first real request.
+        """
+        signature = [tf.TensorSpec(shape=[None, 224, 224, 3], dtype=tf.float32)]
+        try:
+            self._infer = tf.function(
+                lambda x: self.model(x, training=False),
+                input_signature=signature,
+                jit_compile=True
+            )
+            self._infer(tf.zeros([1, 224, 224, 3]))
+        except Exception as e:
+            logger.warning(f"XLA compilation failed, using non-JIT graph: {e}")
+            self._infer = tf.function(
+                lambda x: self.model(x, training=False),
+                input_signature=signature
+            )
+            self._infer(tf.zeros([1, 224, 224, 3]))
+
+    def _load_tflite_model(self):
+        """
+        Load (or build) a quantized TFLite version of the model
+
+        Quantized int8 kernels roughly quarter the model size and speed up
+        CPU inference considerably, so the TFLite interpreter is preferred
+        when available. Falls back to the Keras model on any failure.
+        """
+        try:
+            if not self._artifact_is_stale(self.tflite_path):
+                with open(self.tflite_path, "rb") as f:
+                    self._tflite_model = f.read()
+                logger.info("Loaded quantized TFLite model")
+            else:
+                # Convert the Keras model with dynamic-range quantization
+                # (no calibration dataset is needed, input/output stay float32)
+                converter = tf.lite.TFLiteConverter.from_keras_model(self.model)
+                converter.optimizations = [tf.lite.Optimize.DEFAULT]
+                self._tflite_model = converter.convert()
+
+                # Write to a per-process temp file and publish with an
+                # atomic rename so concurrent workers never read a
+                # half-written artifact
+                tmp_path = f"{self.tflite_path}.tmp-{os.getpid()}"
+                try:
+                    with open(tmp_path, "wb") as f:
+                        f.write(self._tflite_model)
+                    os.replace(tmp_path, self.tflite_path)
+                finally:
+                    if os.path.exists(tmp_path):
+                        os.remove(tmp_path)
+                logger.info("Converted model to quantized TFLite")
+
+            # Validate the bytes eagerly: a corrupt cache file must fail
+            # here (falling back to the Keras path) rather than on the
+            # first request, where predict_batch would swallow it into
+            # the fallback response indefinitely
+            interpreter = tf.lite.Interpreter(model_content=self._tflite_model)
+            interpreter.allocate_tensors()
+
+        except Exception as e:
+            logger.warning(f"TFLite conversion failed, using Keras model: {e}")
+            self._tflite_model = None
+
+    def _get_interpreter(self) -> "tf.lite.Interpreter":
+        """Get (or create) the TFLite interpreter for the current thread"""
+        interpreter = getattr(self._tflite_local, "interpreter", None)
+        if interpreter is None:
+            interpreter = tf.lite.Interpreter(model_content=self._tflite_model)
+            interpreter.allocate_tensors()
+            self._tflite_local.interpreter = interpreter
+        return interpreter
+
+    def _tflite_infer(self, images: np.ndarray) -> np.ndarray:
+        """Run a batch through the quantized TFLite interpreter"""
+        interpreter = self._get_interpreter()
+        input_detail = interpreter.get_input_details()[0]
+        output_detail = interpreter.get_output_details()[0]
+
+        # Resize the input tensor when the batch size changes
+        if input_detail["shape"][0] != len(images):
+            interpreter.resize_tensor_input(
+                input_detail["index"], [len(images), 224, 224, 3]
+            )
+            interpreter.allocate_tensors()
+
+        interpreter.set_tensor(
+            input_detail["index"], images.astype(np.float32, copy=False)
+        )
+        interpreter.invoke()
+        return interpreter.get_tensor(output_detail["index"])
     
     def _create_demo_model(self):
         """Create a simple demo model for testing purposes"""
@@ -152,51 +410,93 @@ class DiseaseDetector:
         Returns:
             Dictionary with prediction results
         """
+        # Add batch dimension if needed (view, no copy)
+        if len(image.shape) == 3:
+            image = image[np.newaxis]
+
+        results = await self.predict_batch(image)
+        return results[0]
+
+    async def predict_batch(
+        self, images: np.ndarray, include_all: bool = False
+    ) -> List[Dict]:
+        """
+        Predict diseases for a batch of preprocessed images
+
+        Args:
+            images: Batch of preprocessed images with shape (N, 224, 224, 3)
+            include_all: Include the full per-class probability map in
+                each result (adds a float conversion per class)
+
+        Returns:
+            List of prediction result dictionaries, one per image
+        """
         if self.model is None:
             await self.load_model()
-        
+
         try:
-            # Add batch dimension if needed
-            if len(image.shape) == 3:
-                image = np.expand_dims(image, axis=0)
-            
-            # Make prediction
-            predictions = self.model.predict(image, verbose=0)
-            
-            # Get the class with highest probability
-            predicted_class_idx = np.argmax(predictions[0])
-            confidence = float(predictions[0][predicted_class_idx])
-            disease_name = self.class_names[predicted_class_idx]
-            
-            # Get recommendations
-            recommendations = self.recommendations.get(disease_name, [
-                "Consult with a plant pathologist for specific treatment advice.",
-                "Monitor the plant closely for changes.",
-                "Consider isolating the plant if symptoms worsen."
-            ])
-            
-            return {
-                "disease": disease_name,
-                "confidence": confidence,
-                "recommendations": recommendations,
-                "all_predictions": {
-                    self.class_names[i]: float(predictions[0][i]) 
-                    for i in range(len(self.class_names))
-                }
-            }
-            
+            # Single forward pass for the whole batch, run in a worker
+            # thread so the TF call doesn't block the event loop
+            loop = asyncio.get_event_loop()
+            if self._onnx_session is not None:
+                predictions = await loop.run_in_executor(
+                    None, self._onnx_infer, images
+                )
+            elif self._tflite_model is not None:
+                predictions = await loop.run_in_executor(
+                    None, self._tflite_infer, images
+                )
+            else:
+                batch = tf.convert_to_tensor(images, dtype=tf.float32)
+                predictions = await loop.run_in_executor(None, self._infer, batch)
+                predictions = predictions.numpy()
+            return [self._format_prediction(row, include_all) for row in predictions]
+
         except Exception as e:
-            logger.error(f"Prediction failed: {e}")
-            # Return a safe fallback response
-            return {
-                "disease": "Analysis Failed",
-                "confidence": 0.0,
-                "recommendations": [
-                    "Unable to analyze image. Please try again with a clearer image.",
-                    "Ensure the image shows a clear view of plant leaves.",
-                    "Contact support if the problem persists."
-                ]
-            }
+            logger.error("Prediction failed: %s", e)
+            # Return a safe fallback response for each image
+            return [self._fallback_prediction() for _ in range(len(images))]
+
+    def _format_prediction(
+        self, probabilities: np.ndarray, include_all: bool = False
+    ) -> Dict:
+        """Build a prediction result dict from a single row of class probabilities"""
+        predicted_class_idx = int(probabilities.argmax())
+        confidence = probabilities[predicted_class_idx].item()
+        disease_name = self._class_names_tuple[predicted_class_idx]
+
+        # Get recommendations
+        recommendations = self.recommendations.get(disease_name, (
+            "Consult with a plant pathologist for specific treatment advice.",
+            "Monitor the plant closely for changes.",
+            "Consider isolating the plant if symptoms worsen."
+        ))
+
+        result = {
+            "disease": disease_name,
+            "confidence": confidence,
+            "recommendations": recommendations
+        }
+
+        if include_all:
+            # tolist() converts all probabilities to floats in one C call
+            result["all_predictions"] = dict(
+                zip(self._class_names_tuple, probabilities.tolist())
+            )
+
+        return result
+
+    def _fallback_prediction(self) -> Dict:
+        """Safe response returned when inference fails"""
+        return {
+            "disease": self.ANALYSIS_FAILED,
+            "confidence": 0.0,
+            "recommendations": [
+                "Unable to analyze image. Please try again with a clearer image.",
+                "Ensure the image shows a clear view of plant leaves.",
+                "Contact support if the problem persists."
+            ]
+        }
     
     def is_loaded(self) -> bool:
         """Check if model is loaded"""
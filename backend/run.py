@@ -2,8 +2,15 @@
 """
 Start script for the Plant Disease Detector backend
 """
-import uvicorn
 import os
+
+# Enable oneDNN-optimized TF kernels (AVX2/AVX-512 where the CPU supports
+# them). Must be set before TensorFlow is imported, which happens in the
+# worker processes spawned below.
+os.environ.setdefault("TF_ENABLE_ONEDNN_OPTS", "1")
+os.environ.setdefault("TF_ENABLE_MKL_NATIVE_FORMAT", "1")
+
+import uvicorn
 import sys
 
 def main():
@@ -11,16 +18,29 @@ def main():
     # Add the backend directory to Python path
     backend_dir = os.path.dirname(os.path.abspath(__file__))
     sys.path.insert(0, backend_dir)
-    
-    # Start the server
-    uvicorn.run(
-        "main:app",
-        host="0.0.0.0",
-        port=5000,
-        reload=True,  # Enable auto-reload for development
-        reload_dirs=[backend_dir],
-        log_level="info"
-    )
+
+    if "--dev" in sys.argv:
+        # Development mode: single worker with auto-reload
+        uvicorn.run(
+            "main:app",
+            host="0.0.0.0",
+            port=5000,
+            reload=True,
+            reload_dirs=[backend_dir],
+            log_level="info"
+        )
+    else:
+        # Production mode: uvloop event loop, httptools HTTP parser and
+        # one worker per core (each worker loads its own model copy)
+        uvicorn.run(
+            "main:app",
+            host="0.0.0.0",
+            port=5000,
+            loop="uvloop",
+            http="httptools",
+            workers=os.cpu_count(),
+            log_level="info"
+        )
 
 if __name__ == "__main__":
     main()